@@ -0,0 +1,70 @@
+# cython: language_level=3
+# Compiled allocation kernel with the same contract as main._allocate_numba.
+# Build it next to main.py with:  cythonize -i allocate.pyx
+import numpy as np
+
+cimport cython
+from libc.stdint cimport int64_t
+from libc.string cimport memmove
+
+
+cdef inline Py_ssize_t _lower_bound(const int64_t* keys, const int64_t* ids, Py_ssize_t n,
+                                    int64_t key, int64_t idx) noexcept nogil:
+    # First position in keys[:n]/ids[:n], sorted by (key, id), whose pair is
+    # not less than (key, idx)
+    cdef Py_ssize_t lo = 0, hi = n, mid
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if keys[mid] < key or (keys[mid] == key and ids[mid] < idx):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _allocate(int64_t[::1] reel_remaining, const int64_t[::1] reel_order, const int64_t[::1] reel_starts,
+                    const int64_t[::1] cut_len, const int64_t[::1] sort_order, const int64_t[::1] cut_starts,
+                    int64_t[::1] assign_idx, int64_t[::1] keys, int64_t[::1] ids) noexcept nogil:
+    # keys/ids hold the group's open lengths as (remaining, index) pairs kept
+    # sorted, so the best fit is a binary search and the roomiest is last
+    cdef Py_ssize_t g, j, k, n, pos, ins
+    cdef int64_t c, r, cut, remaining
+
+    for g in range(cut_starts.shape[0] - 1):
+        n = reel_starts[g + 1] - reel_starts[g]
+        if n == 0:
+            continue
+        for j in range(n):
+            ids[j] = reel_order[reel_starts[g] + j]
+            keys[j] = reel_remaining[ids[j]]
+
+        for k in range(cut_starts[g], cut_starts[g + 1]):
+            c = sort_order[k]
+            cut = cut_len[c]
+            if cut > keys[n - 1]:
+                continue
+            pos = _lower_bound(&keys[0], &ids[0], n, cut, -1)
+            r = ids[pos]
+            remaining = keys[pos] - cut
+            # The shrunk length moves down to its sorted place in [0, pos]
+            ins = _lower_bound(&keys[0], &ids[0], pos, remaining, r)
+            if ins < pos:
+                memmove(&keys[ins + 1], &keys[ins], (pos - ins) * sizeof(int64_t))
+                memmove(&ids[ins + 1], &ids[ins], (pos - ins) * sizeof(int64_t))
+            keys[ins] = remaining
+            ids[ins] = r
+            reel_remaining[r] = remaining
+            assign_idx[c] = r
+
+
+def allocate(int64_t[::1] reel_remaining, const int64_t[::1] reel_order, const int64_t[::1] reel_starts,
+             const int64_t[::1] cut_len, const int64_t[::1] sort_order, const int64_t[::1] cut_starts):
+    assign = np.full(cut_len.shape[0], -1, dtype=np.int64)
+    cdef int64_t[::1] assign_idx = assign
+    cdef int64_t[::1] keys = np.empty(max(reel_order.shape[0], 1), dtype=np.int64)
+    cdef int64_t[::1] ids = np.empty(max(reel_order.shape[0], 1), dtype=np.int64)
+    with nogil:
+        _allocate(reel_remaining, reel_order, reel_starts, cut_len, sort_order, cut_starts, assign_idx, keys, ids)
+    return assign
@@ -1,57 +1,210 @@
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
+import numpy as np
 import pandas as pd
-from collections import defaultdict
-import csv
-
-def allocate_cuts_by_item_number(lengths, cuts):
-    lengths_by_item = defaultdict(list)
-    for r in lengths:
-        r["remaining"] = r["length"]
-        r["cuts"] = []
-        lengths_by_item[r["item_number"]].append(r)
-
-    cuts_by_item = defaultdict(list)
-    for c in cuts:
-        cuts_by_item[c["item_number"]].append(c["length"])
-
-    all_results = []
-    all_unassigned = []
-
-    for item_number, item_cuts in cuts_by_item.items():
-        sorted_cuts = sorted(item_cuts, reverse=True)
-        item_lengths = lengths_by_item.get(item_number, [])
-        unassigned = []
-
-        for cut in sorted_cuts:
-            placed = False
-            for length in item_lengths:
-                if length["remaining"] >= cut:
-                    length["cuts"].append(cut)
-                    length["remaining"] -= cut
-                    placed = True
-                    break
-            if not placed:
-                unassigned.append((cut, item_number))
-
-        all_results.extend(item_lengths)
-        all_unassigned.extend(unassigned)
-
-    return all_results, all_unassigned
+from sortedcontainers import SortedList
+
+# Read identifiers as text and lengths as floats so pandas skips dtype inference.
+CSV_DTYPES = {"serial": str, "item_number": str, "length": np.float64}
+
+# Lengths are held as integer thousandths so fits are compared exactly.
+SCALE = 1000
+
+def to_fixed_point(lengths):
+    return np.rint(np.asarray(lengths, dtype=np.float64) * SCALE).astype(np.int64)
+
+def format_lengths(values):
+    # Fixed-point lengths back to their shortest decimal text, e.g. 50000 -> "50"
+    text = np.char.mod("%.3f", np.asarray(values) / SCALE)
+    return np.char.rstrip(np.char.rstrip(text, "0"), ".")
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+# Compiled kernel built from allocate.pyx; preferred over numba when present
+try:
+    from allocate import allocate as _allocate_cython
+except ImportError:
+    _allocate_cython = None
+
+@njit(cache=True, nogil=True)
+def _lower_bound(keys, ids, n, key, idx):
+    # First position in keys[:n]/ids[:n], sorted by (key, id), whose pair is
+    # not less than (key, idx)
+    lo = 0
+    hi = n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if keys[mid] < key or (keys[mid] == key and ids[mid] < idx):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+@njit(cache=True, nogil=True)
+def _allocate_numba(reel_remaining, reel_order, reel_starts, cut_len, sort_order, cut_starts):
+    # Item group g owns lengths reel_order[reel_starts[g]:reel_starts[g + 1]],
+    # ordered by remaining then index, and cuts
+    # sort_order[cut_starts[g]:cut_starts[g + 1]], longest cut first.
+    # Each cut goes to the tightest length that still fits it; ties go to the
+    # lowest length index. reel_remaining is updated in place.
+    assign_idx = np.full(cut_len.shape[0], -1, np.int64)
+    # The group's open lengths as parallel (remaining, index) arrays kept
+    # sorted, so the best fit is a binary search and the roomiest is last
+    keys = np.empty(reel_order.shape[0], np.int64)
+    ids = np.empty(reel_order.shape[0], np.int64)
+    for g in range(cut_starts.shape[0] - 1):
+        n = reel_starts[g + 1] - reel_starts[g]
+        # No lengths for this item: every cut in the group stays unassigned
+        if n == 0:
+            continue
+        for j in range(n):
+            ids[j] = reel_order[reel_starts[g] + j]
+            keys[j] = reel_remaining[ids[j]]
+        for k in range(cut_starts[g], cut_starts[g + 1]):
+            c = sort_order[k]
+            cut = cut_len[c]
+            if cut > keys[n - 1]:
+                continue
+            pos = _lower_bound(keys, ids, n, cut, -1)
+            r = ids[pos]
+            remaining = keys[pos] - cut
+            # The shrunk length moves down to its sorted place in [0, pos]
+            ins = _lower_bound(keys, ids, pos, remaining, r)
+            for j in range(pos, ins, -1):
+                keys[j] = keys[j - 1]
+                ids[j] = ids[j - 1]
+            keys[ins] = remaining
+            ids[ins] = r
+            reel_remaining[r] = remaining
+            assign_idx[c] = r
+    return assign_idx
+
+def _allocate_python(reel_remaining, reel_order, reel_starts, cut_len, sort_order, cut_starts):
+    # Same contract as _allocate_numba, used when neither the compiled
+    # allocate extension nor numba is installed.
+    # Best-fit decreasing: keep open lengths ordered by remaining so the
+    # tightest length that still fits each cut is found by bisection.
+    remaining = reel_remaining.tolist()
+    reel_order = reel_order.tolist()
+    reel_starts = reel_starts.tolist()
+    cut_len = cut_len.tolist()
+    sort_order = sort_order.tolist()
+    cut_starts = cut_starts.tolist()
+
+    assign_idx = [-1] * len(cut_len)
+    for g in range(len(cut_starts) - 1):
+        if reel_starts[g] == reel_starts[g + 1]:
+            continue
+        open_lengths = SortedList((remaining[i], i) for i in reel_order[reel_starts[g]:reel_starts[g + 1]])
+        # Bound methods in locals keep attribute lookups out of the per-cut loop
+        bisect_left, pop, add = open_lengths.bisect_left, open_lengths.pop, open_lengths.add
+        for c in sort_order[cut_starts[g]:cut_starts[g + 1]]:
+            cut = cut_len[c]
+            idx = bisect_left((cut, -1))
+            if idx == len(open_lengths):
+                continue
+            rem, i = pop(idx)
+            remaining[i] = rem = rem - cut
+            add((rem, i))
+            assign_idx[c] = i
+
+    reel_remaining[:] = remaining
+    return np.array(assign_idx, dtype=np.int64)
+
+def group_bounds(sorted_codes, n_groups):
+    # Start offsets of codes 0..n_groups-1 in an ascending code array, plus
+    # the end of the last group; codes below 0 fall before the first group.
+    return np.searchsorted(sorted_codes, np.arange(n_groups + 1))
+
+def sort_cuts_by_item(cut_items, cut_lens):
+    # Code each cut's item number and order cuts by item, longest first.
+    # Depends only on the cuts, so the app reuses it across optimize runs.
+    cut_item, items = pd.factorize(cut_items)
+    if len(items) == 1 and (cut_item == 0).all():
+        # Single item and no blank item numbers (code -1): one group, so
+        # only the lengths need ordering
+        sort_order = np.argsort(-np.asarray(cut_lens, dtype=np.int64), kind="stable")
+        return pd.Index(items), sort_order, np.array([0, len(sort_order)], dtype=np.int64)
+
+    cut_item = cut_item.astype(np.int64)
+    sort_order = np.lexsort((-np.asarray(cut_lens, dtype=np.int64), cut_item))
+    cut_starts = group_bounds(cut_item[sort_order], len(items))
+    return pd.Index(items), sort_order, cut_starts
+
+def allocate_cuts_by_item_number(length_items, length_lens, cut_items, cut_lens, sorted_cuts=None):
+    # Returns the cut lengths assigned to each length (by index, longest
+    # first), the (cut_length, item_number) pairs that didn't fit, and the
+    # length index each cut was placed on (-1 if none). All lengths, in and
+    # out, are fixed-point thousandths (see SCALE). The input arrays are left
+    # untouched.
+    if sorted_cuts is None:
+        sorted_cuts = sort_cuts_by_item(cut_items, cut_lens)
+    items, sort_order, cut_starts = sorted_cuts
+    reel_remaining = np.array(length_lens, dtype=np.int64)
+    # Lengths whose item has no cuts get -1 and sort ahead of every group;
+    # within a group lengths are ordered by remaining, then index
+    reel_item = items.get_indexer(length_items)
+    if len(items) == 1:
+        # Single item: its lengths are the only group
+        members = np.flatnonzero(reel_item == 0)
+        reel_order = members[np.argsort(reel_remaining[members], kind="stable")]
+        reel_starts = np.array([0, len(reel_order)], dtype=np.int64)
+    else:
+        reel_order = np.lexsort((reel_remaining, reel_item))
+        reel_starts = group_bounds(reel_item[reel_order], len(items))
+    cut_len = np.asarray(cut_lens, dtype=np.int64)
+
+    if _allocate_cython is not None:
+        allocate = _allocate_cython
+    elif HAVE_NUMBA:
+        allocate = _allocate_numba
+    else:
+        allocate = _allocate_python
+    assign_idx = allocate(reel_remaining, reel_order, reel_starts, cut_len, sort_order, cut_starts)
+
+    assignments = [[] for _ in range(len(reel_remaining))]
+    cut_items = cut_items.tolist()
+    cut_lens = cut_len.tolist()
+    placed_on = assign_idx.tolist()
+    unassigned = []
+    for c in sort_order.tolist():
+        i = placed_on[c]
+        if i == -1:
+            unassigned.append((cut_lens[c], cut_items[c]))
+        else:
+            assignments[i].append(cut_lens[c])
+
+    return assignments, unassigned, assign_idx
 
 class OptiCutApp:
     def __init__(self, root):
         self.root = root
         self.root.title("OptiCut")
 
-        self.lengths = []
-        self.cuts = []
-        self.optimized_result = []
+        self.lengths_serial = np.empty(0, dtype=object)
+        self.lengths_item = np.empty(0, dtype=object)
+        self.lengths_len = np.empty(0, dtype=np.int64)
+        self.cuts_item = np.empty(0, dtype=object)
+        self.cuts_len = np.empty(0, dtype=np.int64)
+        self.sorted_cuts = None
+        self.assigned_item = None
+        self.assigned_serial = None
+        self.assigned_cut = None
         self.leftovers = []
 
         # Top buttons
-        tk.Button(root, text="Load Lengths CSV", command=self.load_lengths).grid(row=0, column=0, padx=5, pady=5)
-        tk.Button(root, text="Load Cuts CSV", command=self.load_cuts).grid(row=0, column=1, padx=5, pady=5)
+        load_lengths_button = tk.Button(root, text="Load Lengths CSV", command=self.load_lengths)
+        load_lengths_button.grid(row=0, column=0, padx=5, pady=5)
+        load_cuts_button = tk.Button(root, text="Load Cuts CSV", command=self.load_cuts)
+        load_cuts_button.grid(row=0, column=1, padx=5, pady=5)
 
         # Labels
         tk.Label(root, text="Lengths").grid(row=1, column=0)
@@ -67,102 +220,166 @@ class OptiCutApp:
         button_frame = tk.Frame(root)
         button_frame.grid(row=2, column=2, sticky="n", padx=10)
 
-        tk.Button(button_frame, text="Optimize Cuts", command=self.optimize, width=20).pack(pady=5)
+        optimize_button = tk.Button(button_frame, text="Optimize Cuts", command=self.optimize, width=20)
+        optimize_button.pack(pady=5)
         tk.Button(button_frame, text="Export Assignments to CSV", command=self.export_assignments, width=20).pack(pady=5)
 
+        # Shown while optimization runs in the background
+        self.progress = ttk.Progressbar(button_frame, mode="indeterminate", length=150)
+
+        # Disabled while optimizing so the inputs can't change underneath it
+        self.busy_buttons = (load_lengths_button, load_cuts_button, optimize_button)
+
     def create_treeview(self, root, columns, height, row, column):
         tree = ttk.Treeview(root, columns=columns, show="headings", height=height)
         for col in columns:
             tree.heading(col, text=col, command=lambda c=col, t=tree: self.sort_treeview(t, c, False))
             tree.column(col, width=100)
         tree.grid(row=row, column=column, padx=5, pady=5)
+        # Python-side copy of the rows (item id -> values, in fill order), so
+        # sorting doesn't have to read every cell back from Tk
+        tree.column_names = columns
+        tree.row_values = {}
         return tree
 
+    def fill_treeview(self, tree, rows):
+        # Hide the tree while it's repopulated so Tk lays it out once, not per row
+        tree.grid_remove()
+        tree.delete(*tree.get_children())
+        insert, end = tree.insert, tk.END
+        tree.row_values = {insert("", end, values=values): values for values in rows}
+        tree.grid()
+
+    def update_treeview(self, tree, rows, tags):
+        # Rewrite the rows from the last fill in place, in their fill order
+        tree.grid_remove()
+        row_ids = list(tree.row_values)
+        rows = list(rows)
+        item = tree.item
+        for k, values, tag in zip(row_ids, rows, tags):
+            item(k, values=values, tags=(tag,))
+        tree.row_values = dict(zip(row_ids, rows))
+        tree.grid()
+
     def sort_treeview(self, tree, col, reverse):
-        data = [(tree.set(k, col), k) for k in tree.get_children("")]
+        # Start from the displayed order so ties keep the previous sort
+        col_index = tree.column_names.index(col)
+        row_values = tree.row_values
+        data = [(str(row_values[k][col_index]), k) for k in tree.get_children("")]
         try:
             data.sort(key=lambda t: float(t[0]), reverse=reverse)
         except ValueError:
             data.sort(reverse=reverse)
+        move = tree.move
         for index, (val, k) in enumerate(data):
-            tree.move(k, "", index)
+            move(k, "", index)
         tree.heading(col, command=lambda: self.sort_treeview(tree, col, not reverse))
 
     def load_lengths(self):
         file_path = filedialog.askopenfilename()
         try:
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(file_path, dtype=CSV_DTYPES, engine="c")
             required_cols = {"serial", "length", "item_number"}
             if not required_cols.issubset(df.columns):
                 raise ValueError("Missing required columns in Lengths CSV (serial, length, item_number)")
 
-            self.lengths = df.to_dict(orient="records")
-            for row in self.lengths_tree.get_children():
-                self.lengths_tree.delete(row)
+            if df["length"].isna().any():
+                raise ValueError("Missing length values in Lengths CSV")
 
-            for r in self.lengths:
-                self.lengths_tree.insert("", tk.END, values=(r['serial'], r['item_number'], r['length']))
+            self.lengths_serial = np.asarray(df["serial"].values, dtype=object)
+            self.lengths_item = np.asarray(df["item_number"].values, dtype=object)
+            self.lengths_len = to_fixed_point(df["length"].values)
+            self.fill_treeview(
+                self.lengths_tree,
+                zip(self.lengths_serial.tolist(), self.lengths_item.tolist(), format_lengths(self.lengths_len).tolist()),
+            )
 
-            messagebox.showinfo("Success", f"Loaded {len(self.lengths)} lengths.")
+            messagebox.showinfo("Success", f"Loaded {len(self.lengths_len)} lengths.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load lengths:\n{e}")
 
     def load_cuts(self):
         file_path = filedialog.askopenfilename()
         try:
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(file_path, dtype=CSV_DTYPES, engine="c")
             required_cols = {"length", "item_number"}
             if not required_cols.issubset(df.columns):
                 raise ValueError("Missing required columns in Cuts CSV (length, item_number)")
 
-            self.cuts = df.to_dict(orient="records")
-            for row in self.cuts_tree.get_children():
-                self.cuts_tree.delete(row)
+            if df["length"].isna().any():
+                raise ValueError("Missing length values in Cuts CSV")
 
-            for c in self.cuts:
-                self.cuts_tree.insert("", tk.END, values=(c['item_number'], c['length'], ""))
+            self.cuts_item = np.asarray(df["item_number"].values, dtype=object)
+            self.cuts_len = to_fixed_point(df["length"].values)
+            self.sorted_cuts = None
+            self.fill_treeview(
+                self.cuts_tree,
+                ((i, l, "") for i, l in zip(self.cuts_item.tolist(), format_lengths(self.cuts_len).tolist())),
+            )
 
-            messagebox.showinfo("Success", f"Loaded {len(self.cuts)} cuts.")
+            messagebox.showinfo("Success", f"Loaded {len(self.cuts_len)} cuts.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load cuts:\n{e}")
 
     def optimize(self):
-        if not self.lengths or not self.cuts:
+        if not len(self.lengths_len) or not len(self.cuts_len):
             messagebox.showwarning("Missing Data", "Please load both lengths and cuts.")
             return
 
-        result, leftovers = allocate_cuts_by_item_number(self.lengths.copy(), self.cuts)
-        self.optimized_result = result
-        self.leftovers = leftovers
-
-        for row in self.cuts_tree.get_children():
-            self.cuts_tree.delete(row)
-
-        # Map (item_number, cut_length) to serials
-        cut_serial_map = []
-        for length in result:
-            for cut in length["cuts"]:
-                cut_serial_map.append((length["item_number"], cut, length["serial"]))
-
-        used_serials = defaultdict(list)
-        for item_num, cut_len, serial in cut_serial_map:
-            used_serials[(item_num, cut_len)].append(serial)
-
-        for c in self.cuts:
-            key = (c['item_number'], c['length'])
-            if key in used_serials and used_serials[key]:
-                serial = used_serials[key].pop(0)
-                tag = "green"
-            else:
-                serial = ""
-                tag = "red"
-            self.cuts_tree.insert("", tk.END, values=(c['item_number'], c['length'], serial), tags=(tag,))
+        if self.sorted_cuts is None:
+            self.sorted_cuts = sort_cuts_by_item(self.cuts_item, self.cuts_len)
+
+        self.set_busy(True)
+        threading.Thread(target=self.run_allocation, daemon=True).start()
+
+    def set_busy(self, busy):
+        for button in self.busy_buttons:
+            button.config(state=tk.DISABLED if busy else tk.NORMAL)
+        if busy:
+            self.progress.pack(pady=5)
+            self.progress.start(10)
+        else:
+            self.progress.stop()
+            self.progress.pack_forget()
+
+    def run_allocation(self):
+        # Worker thread: only the allocator runs here, Tk is touched via after()
+        try:
+            assignments, leftovers, placement = allocate_cuts_by_item_number(
+                self.lengths_item, self.lengths_len, self.cuts_item, self.cuts_len, self.sorted_cuts
+            )
+        except Exception as e:
+            self.root.after(0, self.show_allocation_error, e)
+        else:
+            self.root.after(0, self.show_results, assignments, leftovers, placement)
+
+    def show_allocation_error(self, error):
+        self.set_busy(False)
+        messagebox.showerror("Error", f"Failed to optimize:\n{error}")
+
+    def show_results(self, assignments, leftovers, placement):
+        self.set_busy(False)
+        # Back from fixed-point thousandths to the CSV's units
+        self.leftovers = [(cut / SCALE, item_num) for cut, item_num in leftovers]
+
+        # Flatten assignments into export columns, one row per assigned cut
+        counts = [len(cuts) for cuts in assignments]
+        self.assigned_item = np.repeat(self.lengths_item, counts)
+        self.assigned_serial = np.repeat(self.lengths_serial, counts)
+        self.assigned_cut = np.fromiter((cut for cuts in assignments for cut in cuts), dtype=np.int64, count=sum(counts))
+
+        # Each cut's serial comes straight from the length it was placed on
+        placed = placement >= 0
+        serials = np.where(placed, self.lengths_serial[placement], "")
+        tags = np.where(placed, "green", "red")
+        rows = zip(self.cuts_item.tolist(), format_lengths(self.cuts_len).tolist(), serials.tolist())
+        self.update_treeview(self.cuts_tree, rows, tags.tolist())
 
         self.cuts_tree.tag_configure("green", background="pale green")
         self.cuts_tree.tag_configure("red", background="#ff9999")
 
     def export_assignments(self):
-        if not self.optimized_result:
+        if self.assigned_cut is None:
             messagebox.showwarning("No Data", "Run optimization first.")
             return
 
@@ -171,12 +388,11 @@ class OptiCutApp:
             return
 
         try:
-            with open(file_path, mode='w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(["item_number", "serial", "cut_length"])
-                for length in self.optimized_result:
-                    for cut in length["cuts"]:
-                        writer.writerow([length["item_number"], length["serial"], cut])
+            pd.DataFrame({
+                "item_number": self.assigned_item,
+                "serial": self.assigned_serial,
+                "cut_length": format_lengths(self.assigned_cut),
+            }).to_csv(file_path, index=False)
             messagebox.showinfo("Success", f"Exported assignments to:\n{file_path}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to export:\n{e}")